@@ -43,6 +43,48 @@ def build_from_path(hparams, input_dirs, mel_dir, linear_dir, wav_dir, n_jobs=12
 	return [future.result() for future in tqdm(futures) if future.result() is not None]
 
 
+def pack_spectrograms(metadata, spectrogram_dir, filename_index, out_path, offsets_path, names_path):
+	"""
+	Concatenates the spectrograms of all examples into a single .npy file along with an offsets table,
+	so that the training feeder can memory map one file instead of opening one file per example.
+	Examples follow the order of metadata, so the file must be packed again whenever train.txt changes
+
+	Args:
+		- metadata: list of examples as written to train.txt
+		- spectrogram_dir: directory containing the spectrograms of each example
+		- filename_index: position of the spectrogram filename in the metadata entries
+		- out_path: path of the packed spectrograms file
+		- offsets_path: path of the offsets file, example i spans frames [offsets[i], offsets[i + 1])
+		- names_path: path of the file listing the spectrogram filename of each example, used by the feeder to check the order
+	"""
+	offsets = np.zeros(len(metadata) + 1, dtype=np.int64)
+	offsets[1:] = np.cumsum([int(m[4]) for m in metadata])
+
+	first = np.load(os.path.join(spectrogram_dir, metadata[0][filename_index]), mmap_mode='r')
+	packed = np.lib.format.open_memmap(out_path, mode='w+', dtype=first.dtype, shape=(int(offsets[-1]), first.shape[1]))
+	for m, start, end in zip(metadata, offsets[:-1], offsets[1:]):
+		packed[start:end] = np.load(os.path.join(spectrogram_dir, m[filename_index]))
+	packed.flush()
+	np.save(offsets_path, offsets, allow_pickle=False)
+	np.save(names_path, np.array([m[filename_index] for m in metadata]), allow_pickle=False)
+
+
+def pack_embeddings(metadata, embedding_dir, out_path, names_path):
+	"""
+	Stacks the (squeezed) speaker embeddings of all examples into a single [examples, speaker_dim] .npy file.
+	Rows follow the order of metadata, so the file must be packed again whenever train.txt changes
+
+	Args:
+		- metadata: list of examples as written to train.txt
+		- embedding_dir: directory containing the speaker embedding of each example, named after its mel filename
+		- out_path: path of the packed embeddings file
+		- names_path: path of the file listing the mel filename of each row, used by the feeder to check the order
+	"""
+	embeddings = np.stack([np.squeeze(np.load(os.path.join(embedding_dir, m[1]))) for m in metadata]).astype(np.float32)
+	np.save(out_path, embeddings, allow_pickle=False)
+	np.save(names_path, np.array([m[1] for m in metadata]), allow_pickle=False)
+
+
 def _process_utterance(mel_dir, linear_dir, wav_dir, index, wav_path, text, speaker_id, hparams):
 	"""
 	Preprocesses a single utterance wav/text pair
@@ -138,9 +180,10 @@ def _process_utterance(mel_dir, linear_dir, wav_dir, index, wav_path, text, spea
 	mel_filename = 'mel-{}.npy'.format(index)
 	linear_filename = 'linear-{}.npy'.format(index)
 	np.save(os.path.join(wav_dir, audio_filename), out.astype(out_dtype), allow_pickle=False)
-	np.save(os.path.join(mel_dir, mel_filename), mel_spectrogram.T, allow_pickle=False)
+	spectrogram_dtype = np.float16 if hparams.tacotron_fp16_targets else np.float32
+	np.save(os.path.join(mel_dir, mel_filename), np.ascontiguousarray(mel_spectrogram.T, dtype=spectrogram_dtype), allow_pickle=False)
 	if hparams.predict_linear:
-		np.save(os.path.join(linear_dir, linear_filename), linear_spectrogram.T, allow_pickle=False)
+		np.save(os.path.join(linear_dir, linear_filename), np.ascontiguousarray(linear_spectrogram.T, dtype=spectrogram_dtype), allow_pickle=False)
 
 	# Return a tuple describing this training example
 	return (audio_filename, mel_filename, linear_filename, time_steps, mel_frames, text, speaker_id)
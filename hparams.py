@@ -155,6 +155,12 @@ hparams = tf.contrib.training.HParams(
 
 	#performance parameters
 	tacotron_swap_with_cpu = False, #Whether to use cpu as support to gpu for decoder computation (Not recommended: may cause major slowdowns! Only use when critical!)
+	tacotron_feeder_cache_entries = 10000, #Max number of loaded .npy arrays (per kind: mels, linears, embeddings) kept in RAM by the feeder across epochs (0 to disable)
+	tacotron_feeder_preload = False, #Whether to load the cached training arrays in parallel at feeder startup instead of during the first epoch
+	tacotron_prefetch_to_device = True, #Whether to copy the next training batches to the GPU while the current step runs (single GPU training only, ignored when no GPU is available)
+	tacotron_feeder_cpus = 2, #Number of cpu cores the feeder loading and batch padding threads are pinned to, TF threads are restricted to the remaining cores (0 to disable, Linux only)
+	tacotron_malloc_threshold = None, #Opt-in glibc mmap/trim threshold (bytes) set at training start so large feeder buffers are returned to the OS when freed. Disables the dynamic mmap threshold for the whole process (TF tensors included), measure before enabling (e.g. 131072)
+	tacotron_fp16_targets = True, #Whether to store spectrograms and feed training targets as float16 (halves disk and feeder memory traffic). Targets are cast back to float32 in the graph.
 
 	#train/test split ratios, mini-batches sizes
 	tacotron_batch_size = 32, #number of training samples on each training steps
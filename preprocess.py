@@ -16,6 +16,7 @@ def preprocess(args, input_folders, out_dir, hparams):
 	os.makedirs(linear_dir, exist_ok=True)
 	metadata = preprocessor.build_from_path(hparams, input_folders, mel_dir, linear_dir, wav_dir, args.n_jobs, tqdm=tqdm)
 	write_metadata(metadata, out_dir)
+	pack_data(metadata, out_dir, hparams)
 
 
 def write_metadata(metadata, out_dir):
@@ -32,6 +33,34 @@ def write_metadata(metadata, out_dir):
 	print('Max audio timesteps length: {}'.format(max(m[3] for m in metadata)))
 
 
+def pack_data(metadata, out_dir, hparams):
+	print('Packing spectrograms..')
+	preprocessor.pack_spectrograms(metadata, os.path.join(out_dir, 'mels'), 1,
+		os.path.join(out_dir, 'packed_mels.npy'), os.path.join(out_dir, 'packed_mels_offsets.npy'),
+		os.path.join(out_dir, 'packed_mels_names.npy'))
+	if hparams.predict_linear:
+		preprocessor.pack_spectrograms(metadata, os.path.join(out_dir, 'linear'), 2,
+			os.path.join(out_dir, 'packed_linear.npy'), os.path.join(out_dir, 'packed_linear_offsets.npy'),
+			os.path.join(out_dir, 'packed_linear_names.npy'))
+	if hparams.spk_dependent_embedding:
+		#Speaker embeddings are computed outside of this repo from the preprocessed mels, pack them with --pack_only once they exist
+		embedding_dir = os.path.join(out_dir, hparams.embedding_path)
+		if not os.path.isdir(embedding_dir):
+			print('Skipping speaker embeddings packing, {} does not exist yet (run again with --pack_only once computed)'.format(embedding_dir))
+			return
+		embeddings_name = os.path.basename(os.path.normpath(hparams.embedding_path))
+		preprocessor.pack_embeddings(metadata, embedding_dir, os.path.join(out_dir, 'packed_{}.npy'.format(embeddings_name)),
+			os.path.join(out_dir, 'packed_{}_names.npy'.format(embeddings_name)))
+
+
+def run_pack(args, hparams):
+	#Pack an already preprocessed dataset
+	output_folder = os.path.join(args.base_dir, args.output)
+	with open(os.path.join(output_folder, 'train.txt'), encoding='utf-8') as f:
+		metadata = [line.strip().split('|') for line in f]
+	pack_data(metadata, output_folder, hparams)
+
+
 def norm_data(args):
 	print('Selecting data folders..')
 	return [os.path.join(args.base_dir, args.dataset)]
@@ -52,10 +81,14 @@ def main():
 	parser.add_argument('--dataset', default='constituicao')
 	parser.add_argument('--output', default='training_data')
 	parser.add_argument('--n_jobs', type=int, default=cpu_count())
+	parser.add_argument('--pack_only', action='store_true', help='Only pack the spectrograms of an already preprocessed output folder')
 	args = parser.parse_args()
 
 	modified_hp = hparams.parse(args.hparams)
-	run_preprocess(args, modified_hp)
+	if args.pack_only:
+		run_pack(args, modified_hp)
+	else:
+		run_preprocess(args, modified_hp)
 
 
 if __name__ == '__main__':
@@ -1,8 +1,9 @@
 import os
-import threading
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
+import numba
 import numpy as np
 import tensorflow as tf
 from infolog import log
@@ -11,9 +12,39 @@ from tacotron.utils.text import text_to_sequence
 
 _batches_per_group = 64
 
+def _load_npy(path):
+	#Spectrograms saved transposed are loaded in fortran order, make arrays C-contiguous once so padding copies are plain memcpys
+	return np.ascontiguousarray(np.load(path))
+
+@numba.njit(nogil=True, cache=True)
+def _copy_frames(out, data, starts, frames, rows, cols):
+	#Copies frames [starts[i], starts[i] + frames[i]) of data to out[rows[i], cols[i]:]
+	#Serial loop: a batch is a few dozen memcpys, and the kernel is called from the train and eval generators at once
+	#(the numba workqueue threading layer aborts on concurrent parallel regions)
+	for i in range(len(frames)):
+		out[rows[i], cols[i]:cols[i] + frames[i]] = data[starts[i]:starts[i] + frames[i]]
+
+def feeder_cpus(hparams):
+	"""Returns the set of cpus reserved to the feeder threads (the last tacotron_feeder_cpus available ones),
+	or None if pinning is disabled or unsupported
+	"""
+	if not hparams.tacotron_feeder_cpus or not hasattr(os, 'sched_getaffinity'):
+		return None
+	cpus = sorted(os.sched_getaffinity(0))
+	if len(cpus) <= hparams.tacotron_feeder_cpus:
+		return None
+	return set(cpus[-hparams.tacotron_feeder_cpus:])
+
+def _gpu_available():
+	#Physical devices are listed without being created (no gpu memory is allocated), older TF only tells if it was built with CUDA
+	list_physical_devices = getattr(getattr(getattr(tf, 'config', None), 'experimental', None), 'list_physical_devices', None)
+	if list_physical_devices is not None:
+		return len(list_physical_devices('GPU')) > 0
+	return tf.test.is_built_with_cuda()
+
 class Feeder:
 	"""
-		Feeds batches of data into queue on a background thread.
+		Feeds batches of data into tf.data input pipelines.
 	"""
 
 	def __init__(self, coordinator, metadata_filename, hparams):
@@ -22,17 +53,22 @@ class Feeder:
 		self._hparams = hparams
 		self._cleaner_names = [x.strip() for x in hparams.cleaners.split(',')]
 		self._train_offset = 0
-		self._test_offset = 0
 
 		# Load metadata
 		self._mel_dir = os.path.join(os.path.dirname(metadata_filename), 'mels')
 		self._linear_dir = os.path.join(os.path.dirname(metadata_filename), 'linear')
 		self._spk_embedding_dir = os.path.join(os.path.dirname(metadata_filename), hparams.embedding_path)
 		with open(metadata_filename, encoding='utf-8') as f:
-			self._metadata = [line.strip().split('|') for line in f]
+			metadata = [line.strip().split('|') for line in f]
+			#Store metadata fields as parallel arrays indexed by example
+			self._mel_names = np.array([x[1] for x in metadata])
+			self._linear_names = np.array([x[2] for x in metadata])
+			self._mel_lens = np.fromiter((int(x[4]) for x in metadata), dtype=np.int32, count=len(metadata))
+			self._texts = np.array([x[6] for x in metadata])
+			self._speaker_ids = np.fromiter((int(x[7]) for x in metadata), dtype=np.int32, count=len(metadata))
 			frame_shift_ms = hparams.hop_size / hparams.sample_rate
-			hours = sum([int(x[4]) for x in self._metadata]) * frame_shift_ms / (3600)
-			log('Loaded metadata for {} examples ({:.2f} hours)'.format(len(self._metadata), hours))
+			hours = self._mel_lens.sum(dtype=np.int64) * frame_shift_ms / (3600)
+			log('Loaded metadata for {} examples ({:.2f} hours)'.format(len(metadata), hours))
 
 		#Train test split
 		if hparams.tacotron_test_size is None:
@@ -40,7 +76,7 @@ class Feeder:
 
 		test_size = (hparams.tacotron_test_size if hparams.tacotron_test_size is not None
 			else hparams.tacotron_test_batches * hparams.tacotron_batch_size)
-		indices = np.arange(len(self._metadata))
+		indices = np.arange(len(self._mel_lens))
 		train_indices, test_indices = train_test_split(indices,
 			test_size=test_size, random_state=hparams.tacotron_data_random_state)
 
@@ -50,14 +86,43 @@ class Feeder:
 		test_indices = test_indices[:len_test_indices]
 		train_indices = np.concatenate([train_indices, extra_test])
 
-		self._train_meta = list(np.array(self._metadata)[train_indices])
-		self._test_meta = list(np.array(self._metadata)[test_indices])
+		self._train_indices = train_indices
+		self._test_indices = test_indices
 
-		self.test_steps = len(self._test_meta) // hparams.tacotron_batch_size
+		self.test_steps = len(self._test_indices) // hparams.tacotron_batch_size
 
 		if hparams.tacotron_test_size is None:
 			assert hparams.tacotron_test_batches == self.test_steps
 
+		#Texts are static, convert them to sequences once instead of on every example
+		self._text_seq_cache = {text: np.asarray(text_to_sequence(text, self._cleaner_names), dtype=np.int32) for text in set(self._texts)}
+		self._input_lens = np.fromiter((len(self._text_seq_cache[text]) for text in self._texts), dtype=np.int32, count=len(self._texts))
+
+		#Use the spectrograms packed by preprocess.py when available: examples are then slices of a memory mapped file
+		data_dir = os.path.dirname(metadata_filename)
+		self._packed_mels = self._load_packed(os.path.join(data_dir, 'packed_mels.npy'), os.path.join(data_dir, 'packed_mels_offsets.npy'),
+			os.path.join(data_dir, 'packed_mels_names.npy'), self._mel_names)
+		self._packed_linear = (self._load_packed(os.path.join(data_dir, 'packed_linear.npy'), os.path.join(data_dir, 'packed_linear_offsets.npy'),
+			os.path.join(data_dir, 'packed_linear_names.npy'), self._linear_names) if hparams.predict_linear else None)
+		#Speaker embeddings packed as a single [examples, speaker_dim] array, a batch is then one gather
+		embeddings_name = os.path.basename(os.path.normpath(hparams.embedding_path))
+		self._packed_spk_embeddings = (self._load_packed_embeddings(os.path.join(data_dir, 'packed_{}.npy'.format(embeddings_name)),
+			os.path.join(data_dir, 'packed_{}_names.npy'.format(embeddings_name))) if hparams.spk_dependent_embedding else None)
+
+		#Disk reads release the GIL, load the examples of a group on a pool of threads
+		#pinned to their own cores to avoid competing with the TF thread pools
+		self._feeder_cpus = feeder_cpus(hparams)
+		self._executor = ThreadPoolExecutor(max_workers=min(16, os.cpu_count()), initializer=self._pin_thread)
+		#Batches are padded on a thread pinned to the same cores, the tf.data generators only hand them over
+		self._batch_executor = ThreadPoolExecutor(max_workers=1, initializer=self._pin_thread)
+
+		#Keep loaded training arrays in memory to avoid reading them from disk again on the next epochs
+		self._mel_cache = {}
+		self._linear_cache = {}
+		self._spk_embedding_cache = {}
+		if hparams.tacotron_feeder_preload:
+			self._preload_cache()
+
 		#pad input sequences with the <pad_token> 0 ( _ )
 		self._pad = 0
 		#explicitely setting the padding to a value that doesn't originally exist in the spectogram
@@ -68,100 +133,152 @@ class Feeder:
 			self._target_pad = 0.
 		#Mark finished sequences with 1s
 		self._token_pad = 1.
+		#Spectrogram targets are fed as float16 to halve the feeder memory traffic
+		self._target_dtype = np.float16 if hparams.tacotron_fp16_targets else np.float32
+		target_type = tf.float16 if hparams.tacotron_fp16_targets else tf.float32
+		#Read-only frame broadcast as linear target when linear spectrograms are not predicted
+		self._zero_linear_frame = np.zeros((1, hparams.num_freq), dtype=self._target_dtype)
 
 		with tf.device('/cpu:0'):
-			# Create placeholders for inputs and targets. Don't specify batch size because we want
+			# Types and shapes of the batch elements. Don't specify batch size because we want
 			# to be able to feed different batch sizes at eval time.
-			self._placeholders = [
-			tf.placeholder(tf.int32, shape=(None, None), name='inputs'),
-			tf.placeholder(tf.int32, shape=(None, ), name='input_lengths'),
-			tf.placeholder(tf.float32, shape=(None, None, hparams.num_mels), name='mel_targets'),
-			tf.placeholder(tf.float32, shape=(None, None), name='token_targets'),
-			tf.placeholder(tf.float32, shape=(None, None, hparams.num_freq), name='linear_targets'),
-			tf.placeholder(tf.int32, shape=(None, ), name='targets_lengths'),
-			tf.placeholder(tf.int32, shape=(hparams.tacotron_num_gpus, None), name='split_infos'),
-			tf.placeholder(tf.int32, shape=(None, ), name='speaker_id'),
-			]
-			datatype = [tf.int32, tf.int32, tf.float32, tf.float32, tf.float32, tf.int32, tf.int32, tf.int32]
+			datatype = (tf.int32, tf.int32, target_type, tf.float32, target_type, tf.int32, tf.int32, tf.int32)
+			shapes = (
+			tf.TensorShape([None, None]), #inputs
+			tf.TensorShape([None]), #input_lengths
+			tf.TensorShape([None, None, hparams.num_mels]), #mel_targets
+			tf.TensorShape([None, None]), #token_targets
+			tf.TensorShape([None, None, hparams.num_freq]), #linear_targets
+			tf.TensorShape([None]), #targets_lengths
+			tf.TensorShape([hparams.tacotron_num_gpus, None]), #split_infos
+			tf.TensorShape([None]), #speaker_id
+			)
 
 			if hparams.spk_dependent_embedding:
-				self._placeholders += [tf.placeholder(tf.float32, shape=(None, hparams.speaker_dim), name='spk_embeddings')]
-				datatype += [tf.float32]
-
-			# Create queue for buffering data
-			queue = tf.FIFOQueue(_batches_per_group, datatype, name='input_queue')
-			self._enqueue_op = queue.enqueue(self._placeholders)
-			if hparams.spk_dependent_embedding:
-				self.inputs, self.input_lengths, self.mel_targets, self.token_targets, self.linear_targets, \
-					self.targets_lengths, self.split_infos, self.speaker_id, self.spk_embedding = queue.dequeue()
-			else:
-				self.inputs, self.input_lengths, self.mel_targets, self.token_targets, self.linear_targets, \
-					self.targets_lengths, self.split_infos, self.speaker_id = queue.dequeue()
-
-			self.inputs.set_shape(self._placeholders[0].shape)
-			self.input_lengths.set_shape(self._placeholders[1].shape)
-			self.mel_targets.set_shape(self._placeholders[2].shape)
-			self.token_targets.set_shape(self._placeholders[3].shape)
-			self.linear_targets.set_shape(self._placeholders[4].shape)
-			self.targets_lengths.set_shape(self._placeholders[5].shape)
-			self.split_infos.set_shape(self._placeholders[6].shape)
-			self.speaker_id.set_shape(self._placeholders[7].shape)
-			if hparams.spk_dependent_embedding:
-				self.spk_embedding.set_shape(self._placeholders[8].shape)
-
-			# Create eval queue for buffering eval data
-			eval_queue = tf.FIFOQueue(1, datatype, name='eval_queue')
-			self._eval_enqueue_op = eval_queue.enqueue(self._placeholders)
+				datatype += (tf.float32, )
+				shapes += (tf.TensorShape([None, hparams.speaker_dim]), ) #spk_embeddings
+
+			# Create the input pipelines: batches are generated in python (bucketing and multi-GPU
+			# split infos are computed on the numpy side) and buffered ahead of the model by tf.data
+			train_dataset = tf.data.Dataset.from_generator(self._next_train_batch, datatype, shapes)
+			train_dataset = train_dataset.prefetch(tf.data.experimental.AUTOTUNE)
+			#A single GPU consumes the whole batch (no split on the cpu), copy the next batches to it ahead of time
+			train_device = '/cpu:0'
+			if hparams.tacotron_prefetch_to_device and hparams.tacotron_num_gpus == 1 and _gpu_available():
+				train_device = '/gpu:0'
+				train_dataset = train_dataset.apply(tf.data.experimental.prefetch_to_device(train_device, buffer_size=2))
+			train_iterator = train_dataset.make_initializable_iterator()
+			with tf.device(train_device):
+				if hparams.spk_dependent_embedding:
+					self.inputs, self.input_lengths, self.mel_targets, self.token_targets, self.linear_targets, \
+						self.targets_lengths, self.split_infos, self.speaker_id, self.spk_embedding = train_iterator.get_next()
+				else:
+					self.inputs, self.input_lengths, self.mel_targets, self.token_targets, self.linear_targets, \
+						self.targets_lengths, self.split_infos, self.speaker_id = train_iterator.get_next()
+				self.mel_targets = tf.cast(self.mel_targets, tf.float32)
+				self.linear_targets = tf.cast(self.linear_targets, tf.float32)
+
+			eval_dataset = tf.data.Dataset.from_generator(self._next_test_batch, datatype, shapes)
+			eval_dataset = eval_dataset.prefetch(1)
+			eval_iterator = eval_dataset.make_initializable_iterator()
 			if hparams.spk_dependent_embedding:
 				self.eval_inputs, self.eval_input_lengths, self.eval_mel_targets, self.eval_token_targets, \
-                                	self.eval_linear_targets, self.eval_targets_lengths, self.eval_split_infos, self.eval_speaker_id, self.eval_spk_embedding = eval_queue.dequeue()
+					self.eval_linear_targets, self.eval_targets_lengths, self.eval_split_infos, self.eval_speaker_id, self.eval_spk_embedding = eval_iterator.get_next()
 			else:
 				self.eval_inputs, self.eval_input_lengths, self.eval_mel_targets, self.eval_token_targets, \
-					self.eval_linear_targets, self.eval_targets_lengths, self.eval_split_infos, self.eval_speaker_id = eval_queue.dequeue()
-
-			self.eval_inputs.set_shape(self._placeholders[0].shape)
-			self.eval_input_lengths.set_shape(self._placeholders[1].shape)
-			self.eval_mel_targets.set_shape(self._placeholders[2].shape)
-			self.eval_token_targets.set_shape(self._placeholders[3].shape)
-			self.eval_linear_targets.set_shape(self._placeholders[4].shape)
-			self.eval_targets_lengths.set_shape(self._placeholders[5].shape)
-			self.eval_split_infos.set_shape(self._placeholders[6].shape)
-			self.eval_speaker_id.set_shape(self._placeholders[7].shape)
-			if hparams.spk_dependent_embedding:
-                                self.eval_spk_embedding.set_shape(self._placeholders[8].shape)
-
-	def start_threads(self, session):
-		self._session = session
-		thread = threading.Thread(name='background', target=self._enqueue_next_train_group)
-		thread.daemon = True #Thread will close when parent quits
-		thread.start()
-
-		thread = threading.Thread(name='background', target=self._enqueue_next_test_group)
-		thread.daemon = True #Thread will close when parent quits
-		thread.start()
-
-	def _get_test_groups(self):
-		meta = self._test_meta[self._test_offset]
-		self._test_offset += 1
-
-#		text = meta[5]
-#		speaker_id = meta[6]
-		text = meta[6]
-		speaker_id = meta[7]
-
-		input_data = np.asarray(text_to_sequence(text, self._cleaner_names), dtype=np.int32)
-		mel_target = np.load(os.path.join(self._mel_dir, meta[1]))
-		if self._hparams.spk_dependent_embedding:
-			spk_embedding = np.load(os.path.join(self._spk_embedding_dir, meta[1]))
+					self.eval_linear_targets, self.eval_targets_lengths, self.eval_split_infos, self.eval_speaker_id = eval_iterator.get_next()
+			self.eval_mel_targets = tf.cast(self.eval_mel_targets, tf.float32)
+			self.eval_linear_targets = tf.cast(self.eval_linear_targets, tf.float32)
+
+			#Run once in the training session before fetching batches
+			self.initializer = tf.group(train_iterator.initializer, eval_iterator.initializer)
+
+	def _pin_thread(self):
+		if self._feeder_cpus is not None:
+			#pid 0 is the calling thread
+			os.sched_setaffinity(0, self._feeder_cpus)
+
+	def _load_packed(self, path, offsets_path, names_path, names):
+		if not (os.path.isfile(path) and os.path.isfile(offsets_path) and os.path.isfile(names_path)):
+			return None
+		offsets = np.load(offsets_path)
+		if len(offsets) != len(self._mel_lens) + 1:
+			log('Ignoring {}: packed for {} examples, metadata has {}'.format(path, len(offsets) - 1, len(self._mel_lens)))
+			return None
+		#Same example count is not enough (e.g. reordered metadata), every example must be the same file with the same number of frames
+		if not np.array_equal(np.load(names_path), names):
+			log('Ignoring {}: packed for a different metadata order, run preprocess.py --pack_only again'.format(path))
+			return None
+		if not np.array_equal(np.diff(offsets), self._mel_lens):
+			log('Ignoring {}: packed example lengths do not match the metadata, run preprocess.py --pack_only again'.format(path))
+			return None
+		log('Using packed spectrograms from {}'.format(path))
+		return np.load(path, mmap_mode='r'), offsets
+
+	def _load_packed_embeddings(self, path, names_path):
+		if not (os.path.isfile(path) and os.path.isfile(names_path)):
+			return None
+		embeddings = np.load(path)
+		if embeddings.shape != (len(self._mel_lens), self._hparams.speaker_dim):
+			log('Ignoring {}: shape {} does not match the metadata'.format(path, embeddings.shape))
+			return None
+		#Rows follow the order of train.txt at packing time, make sure it is still the same
+		if not np.array_equal(np.load(names_path), self._mel_names):
+			log('Ignoring {}: packed for a different metadata order, run preprocess.py --pack_only again'.format(path))
+			return None
+		log('Using packed speaker embeddings from {}'.format(path))
+		return embeddings
+
+	def _load_spectrogram(self, index, packed, directory, names, cache=None):
+		if packed is not None:
+			data, offsets = packed
+			return data[offsets[index]: offsets[index + 1]]
+		path = os.path.join(directory, names[index])
+		data = _load_npy(path) if cache is None else self._load_cached(path, cache)
+		#Batches are padded to the metadata lengths (packed offsets are checked against them when loaded)
+		if len(data) != self._mel_lens[index]:
+			raise ValueError('{} has {} frames but train.txt lists {}'.format(path, len(data), self._mel_lens[index]))
+		return data
+
+	def _preload_cache(self):
+		start = time.time()
+		if self._packed_mels is None:
+			self._preload(self._mel_cache, [os.path.join(self._mel_dir, name) for name in self._mel_names[self._train_indices]])
+		if self._hparams.predict_linear and self._packed_linear is None:
+			self._preload(self._linear_cache, [os.path.join(self._linear_dir, name) for name in self._linear_names[self._train_indices]])
+		if self._hparams.spk_dependent_embedding and self._packed_spk_embeddings is None:
+			self._preload(self._spk_embedding_cache, [os.path.join(self._spk_embedding_dir, name) for name in self._mel_names[self._train_indices]])
+		log('Preloaded feeder caches in {:.3f} sec'.format(time.time() - start))
+
+	def _preload(self, cache, paths):
+		paths = paths[:self._hparams.tacotron_feeder_cache_entries]
+		for path, data in zip(paths, self._executor.map(_load_npy, paths)):
+			cache[path] = data
+
+	def _load_cached(self, path, cache):
+		"""Loads a .npy file, keeping it in memory for the next epochs while the cache has room
+		"""
+		data = cache.get(path)
+		if data is None:
+			data = _load_npy(path)
+			if len(cache) < self._hparams.tacotron_feeder_cache_entries:
+				cache[path] = data
+		return data
+
+	def _get_test_example(self, index):
+		input_data = self._text_seq_cache[self._texts[index]]
+		mel_target = self._load_spectrogram(index, self._packed_mels, self._mel_dir, self._mel_names)
+		if self._hparams.spk_dependent_embedding and self._packed_spk_embeddings is None:
+			spk_embedding = _load_npy(os.path.join(self._spk_embedding_dir, self._mel_names[index]))
 		else:
 			spk_embedding = None
 		#Create parallel sequences containing zeros to represent a non finished sequence
 		token_target = np.asarray([0.] * (len(mel_target) - 1))
 		if self._hparams.predict_linear:
-			linear_target = np.load(os.path.join(self._linear_dir, meta[2]))
+			linear_target = self._load_spectrogram(index, self._packed_linear, self._linear_dir, self._linear_names)
 		else:
-			linear_target = np.zeros([mel_target.shape[0], self._hparams.num_freq])
-		return (input_data, mel_target, token_target, linear_target, speaker_id, spk_embedding, len(mel_target))
+			linear_target = np.broadcast_to(self._zero_linear_frame, (mel_target.shape[0], self._hparams.num_freq))
+		return (input_data, mel_target, token_target, linear_target, spk_embedding, index)
 
 	def make_test_batches(self):
 		start = time.time()
@@ -170,138 +287,175 @@ class Feeder:
 		n = self._hparams.tacotron_batch_size
 		r = self._hparams.outputs_per_step
 
-		#Test on entire test set
-		examples = [self._get_test_groups() for i in range(len(self._test_meta))]
-
-		# Bucket examples based on similar output sequence length for efficiency
-		examples.sort(key=lambda x: x[-1])
+		#Test on entire test set, bucketing examples based on similar output sequence length for efficiency
+		indices = self._test_indices[np.argsort(self._mel_lens[self._test_indices], kind='stable')]
+		examples = [self._get_test_example(i) for i in indices]
 		batches = [examples[i: i+n] for i in range(0, len(examples), n)]
 		np.random.shuffle(batches)
 
 		log('\nGenerated {} test batches of size {} in {:.3f} sec'.format(len(batches), n, time.time() - start))
 		return batches, r
 
-	def _enqueue_next_train_group(self):
+	def _next_train_batch(self):
+		"""Generator feeding the training tf.data pipeline with prepared batches
+		"""
+		n = self._hparams.tacotron_batch_size
+		r = self._hparams.outputs_per_step
+		#The examples of a group are read into the same buffer for every group
+		examples = [None] * (n * _batches_per_group)
+
+		# Start reading the first group of examples
+		indices = self._next_train_indices(len(examples))
+		futures = [self._executor.submit(self._get_example, i) for i in indices]
 		while not self._coord.should_stop():
 			start = time.time()
 
-			# Read a group of examples
-			n = self._hparams.tacotron_batch_size
-			r = self._hparams.outputs_per_step
-			examples = [self._get_next_example() for i in range(n * _batches_per_group)]
-
+			for i, future in enumerate(futures):
+				examples[i] = future.result()
 			# Bucket examples based on similar output sequence length for efficiency
-			examples.sort(key=lambda x: x[-1])
-			batches = [examples[i: i+n] for i in range(0, len(examples), n)]
-			np.random.shuffle(batches)
-
-			log('\nGenerated {} train batches of size {} in {:.3f} sec'.format(len(batches), n, time.time() - start))
-			for batch in batches:
-				feed_dict = dict(zip(self._placeholders, self._prepare_batch(batch, r)))
-				self._session.run(self._enqueue_op, feed_dict=feed_dict)
-
-	def _enqueue_next_test_group(self):
+			order = np.argsort(self._mel_lens[indices], kind='stable')
+			# Shuffle batches with a single permutation of batch rows. Examples stay sorted inside a batch so that
+			# each device gets a contiguous length range and pads its sub-batch to a tighter max length
+			batches = order.reshape(-1, n)[np.random.permutation(len(order) // n)]
+			device_lens = self._mel_lens[indices][batches].reshape(len(batches), self._hparams.tacotron_num_gpus, -1)
+			padding = 1. - device_lens.sum() / (device_lens.max(axis=2).sum() * device_lens.shape[2])
+
+			# Read the next group on the thread pool while the batches of this one are consumed
+			indices = self._next_train_indices(len(examples))
+			futures = [self._executor.submit(self._get_example, i) for i in indices]
+
+			log('\nGenerated {} train batches of size {} in {:.3f} sec ({:.1%} padding frames)'.format(len(batches), n, time.time() - start, padding))
+			yield from self._prepare_batches(([examples[i] for i in batch] for batch in batches), r)
+
+	def _next_test_batch(self):
+		"""Generator feeding the eval tf.data pipeline with prepared batches
+		"""
 		#Create test batches once and evaluate on them for all test steps
 		test_batches, r = self.make_test_batches()
 		while not self._coord.should_stop():
-			for batch in test_batches:
-				feed_dict = dict(zip(self._placeholders, self._prepare_batch(batch, r)))
-				self._session.run(self._eval_enqueue_op, feed_dict=feed_dict)
+			yield from self._prepare_batches(test_batches, r)
 
-	def _get_next_example(self):
-		"""Gets a single example (input, mel_target, token_target, linear_target, mel_length) from_ disk
+	def _prepare_batches(self, batches, outputs_per_step):
+		"""Prepares batches on the pinned batch thread, one batch ahead of the one handed over to tf.data
 		"""
-		if self._train_offset >= len(self._train_meta):
-			self._train_offset = 0
-			np.random.shuffle(self._train_meta)
-
-		meta = self._train_meta[self._train_offset]
-		self._train_offset += 1
-
-#		text = meta[5]
-#		speaker_id = meta[6]
-		text = meta[6]
-		speaker_id = meta[7]
-
-		input_data = np.asarray(text_to_sequence(text, self._cleaner_names), dtype=np.int32)
-		mel_target = np.load(os.path.join(self._mel_dir, meta[1]))
-		if self._hparams.spk_dependent_embedding:
-			spk_embedding = np.load(os.path.join(self._spk_embedding_dir, meta[1]))
+		future = None
+		for batch in batches:
+			next_future = self._batch_executor.submit(self._prepare_batch, batch, outputs_per_step)
+			if future is not None:
+				yield future.result()
+			future = next_future
+		if future is not None:
+			yield future.result()
+
+	def _next_train_indices(self, count):
+		"""Gets the indices of the next count training examples, reshuffling the training set after each epoch
+		"""
+		indices = []
+		while count > 0:
+			if self._train_offset >= len(self._train_indices):
+				self._train_offset = 0
+				self._train_indices = np.random.permutation(self._train_indices)
+
+			chunk = self._train_indices[self._train_offset: self._train_offset + count]
+			self._train_offset += len(chunk)
+			count -= len(chunk)
+			indices.append(chunk)
+		return np.concatenate(indices)
+
+	def _get_example(self, index):
+		"""Gets a single example (input, mel_target, token_target, linear_target, spk_embedding, index) from_ disk
+		"""
+		input_data = self._text_seq_cache[self._texts[index]]
+		mel_target = self._load_spectrogram(index, self._packed_mels, self._mel_dir, self._mel_names, self._mel_cache)
+		if self._hparams.spk_dependent_embedding and self._packed_spk_embeddings is None:
+			spk_embedding = self._load_cached(os.path.join(self._spk_embedding_dir, self._mel_names[index]), self._spk_embedding_cache)
 		else:
 			spk_embedding = None
 		#Create parallel sequences containing zeros to represent a non finished sequence
 		token_target = np.asarray([0.] * (len(mel_target) - 1))
 		if self._hparams.predict_linear:
-			linear_target = np.load(os.path.join(self._linear_dir, meta[2]))
+			linear_target = self._load_spectrogram(index, self._packed_linear, self._linear_dir, self._linear_names, self._linear_cache)
 		else:
-			linear_target = np.zeros([mel_target.shape[0],self._hparams.num_freq])
-		return (input_data, mel_target, token_target, linear_target, speaker_id, spk_embedding, len(mel_target))
+			linear_target = np.broadcast_to(self._zero_linear_frame, (mel_target.shape[0], self._hparams.num_freq))
+		return (input_data, mel_target, token_target, linear_target, spk_embedding, index)
 
 	def _prepare_batch(self, batches, outputs_per_step):
-		assert 0 == len(batches) % self._hparams.tacotron_num_gpus
-		size_per_device = int(len(batches) / self._hparams.tacotron_num_gpus)
-		np.random.shuffle(batches)
-
-		inputs = None
-		mel_targets = None
-		token_targets = None
-		linear_targets = None
-		targets_lengths = None
-		split_infos = []
-
-		targets_lengths = np.asarray([x[-1] for x in batches], dtype=np.int32) #Used to mask loss
-		input_lengths = np.asarray([len(x[0]) for x in batches], dtype=np.int32)
-		speaker_ids = np.asarray([x[4] for x in batches], dtype=np.int32)
-		if self._hparams.spk_dependent_embedding:
-			spk_embeddings = np.asarray([np.squeeze(x[5]) for x in batches], dtype=np.float32)
+		num_gpus = self._hparams.tacotron_num_gpus
+		assert 0 == len(batches) % num_gpus
+		size_per_device = int(len(batches) / num_gpus)
+
+		#Lengths and speakers are gathered from the metadata arrays
+		indices = np.asarray([x[5] for x in batches])
+		targets_lengths = self._mel_lens[indices] #Used to mask loss
+		input_lengths = self._input_lens[indices]
+		speaker_ids = self._speaker_ids[indices]
+		if self._packed_spk_embeddings is not None:
+			spk_embeddings = self._packed_spk_embeddings[indices]
+		elif self._hparams.spk_dependent_embedding:
+			spk_embeddings = np.asarray([np.squeeze(x[4]) for x in batches], dtype=np.float32)
 
 		#Produce inputs/targets of variables lengths for different GPUs
-		for i in range(self._hparams.tacotron_num_gpus):
-			batch = batches[size_per_device * i: size_per_device * (i + 1)]
-			input_cur_device, input_max_len = self._prepare_inputs([x[0] for x in batch])
-			inputs = np.concatenate((inputs, input_cur_device), axis=1) if inputs is not None else input_cur_device
-			mel_target_cur_device, mel_target_max_len = self._prepare_targets([x[1] for x in batch], outputs_per_step)
-			mel_targets = np.concatenate(( mel_targets, mel_target_cur_device), axis=1) if mel_targets is not None else mel_target_cur_device
-
-			#Pad sequences with 1 to infer that the sequence is done
-			token_target_cur_device, token_target_max_len = self._prepare_token_targets([x[2] for x in batch], outputs_per_step)
-			token_targets = np.concatenate((token_targets, token_target_cur_device),axis=1) if token_targets is not None else token_target_cur_device
-			linear_targets_cur_device, linear_target_max_len = self._prepare_targets([x[3] for x in batch], outputs_per_step)
-			linear_targets = np.concatenate((linear_targets, linear_targets_cur_device), axis=1) if linear_targets is not None else linear_targets_cur_device
-			split_infos.append([input_max_len, mel_target_max_len, token_target_max_len, linear_target_max_len])
-
-		split_infos = np.asarray(split_infos, dtype=np.int32)
+		devices = [batches[size_per_device * i: size_per_device * (i + 1)] for i in range(num_gpus)]
+		indices = indices.reshape(num_gpus, size_per_device)
+		#Mel, <stop_token> (one frame shorter, padded with at least one finished frame) and linear targets are padded alike
+		device_input_lens = input_lengths.reshape(num_gpus, size_per_device).max(axis=1)
+		device_target_lens = self._round_up(targets_lengths.reshape(num_gpus, size_per_device).max(axis=1), outputs_per_step)
+		split_infos = np.stack([device_input_lens, device_target_lens, device_target_lens, device_target_lens], axis=1).astype(np.int32)
+
+		inputs = self._prepare_inputs([[x[0] for x in batch] for batch in devices], split_infos[:, 0])
+		mel_targets = self._prepare_targets([[x[1] for x in batch] for batch in devices], split_infos[:, 1], indices, self._packed_mels)
+		#Pad sequences with 1 to infer that the sequence is done
+		token_targets = self._prepare_token_targets([[x[2] for x in batch] for batch in devices], split_infos[:, 2])
+		linear_targets = self._prepare_targets([[x[3] for x in batch] for batch in devices], split_infos[:, 3], indices, self._packed_linear)
+
 		if self._hparams.spk_dependent_embedding:
 			return (inputs, input_lengths, mel_targets, token_targets, linear_targets, targets_lengths, split_infos, speaker_ids, spk_embeddings)
 		else:
 			return (inputs, input_lengths, mel_targets, token_targets, linear_targets, targets_lengths, split_infos, speaker_ids)
 
-	def _prepare_inputs(self, inputs):
-		max_len = max([len(x) for x in inputs])
-		return np.stack([self._pad_input(x, max_len) for x in inputs]), max_len
+	def _prepare_inputs(self, inputs, lengths):
+		return self._pad_devices(inputs, lengths, self._pad, np.int32)
 
-	def _prepare_targets(self, targets, alignment):
-		max_len = max([len(t) for t in targets])
-		data_len = self._round_up(max_len, alignment)
-		return np.stack([self._pad_target(t, data_len) for t in targets]), data_len
+	def _prepare_targets(self, targets, lengths, indices, packed):
+		if packed is not None and packed[0].dtype == self._target_dtype:
+			return self._pad_packed_devices(indices, lengths, packed)
+		return self._pad_devices(targets, lengths, self._target_pad, self._target_dtype)
 
-	def _prepare_token_targets(self, targets, alignment):
-		max_len = max([len(t) for t in targets]) + 1
-		data_len = self._round_up(max_len, alignment)
-		return np.stack([self._pad_token_target(t, data_len) for t in targets]), data_len
+	def _prepare_token_targets(self, targets, lengths):
+		return self._pad_devices(targets, lengths, self._token_pad, np.float32)
 
-	def _pad_input(self, x, length):
-		return np.pad(x, (0, length - x.shape[0]), mode='constant', constant_values=self._pad)
-
-	def _pad_target(self, t, length):
-		return np.pad(t, [(0, length - t.shape[0]), (0, 0)], mode='constant', constant_values=self._target_pad)
-
-	def _pad_token_target(self, t, length):
-		return np.pad(t, (0, length - t.shape[0]), mode='constant', constant_values=self._token_pad)
+	def _pad_devices(self, devices, lengths, pad_value, dtype):
+		"""Copies the sequences of each device into a single buffer preallocated with the padding value.
+		Devices are laid side by side on the time axis, each one padded to its own length (see split_infos)
+		"""
+		out = np.full((len(devices[0]), np.sum(lengths)) + devices[0][0].shape[1:], pad_value, dtype=dtype)
+		start = 0
+		for sequences, length in zip(devices, lengths):
+			for i, x in enumerate(sequences):
+				out[i, start:start + len(x)] = x
+			start += length
+		return out
+
+	def _pad_packed_devices(self, indices, lengths, packed):
+		"""Same layout as _pad_devices for spectrograms of a packed file, frames are copied straight from the
+		memory map by a compiled kernel running without the GIL
+		"""
+		data, offsets = packed
+		size_per_device = len(indices[0])
+		out = np.full((size_per_device, np.sum(lengths), data.shape[1]), self._target_pad, dtype=self._target_dtype)
+
+		indices = np.concatenate(indices)
+		starts = offsets[indices]
+		rows = np.tile(np.arange(size_per_device), len(lengths))
+		cols = np.repeat(np.cumsum(lengths) - lengths, size_per_device)
+		#Plain copy of the frames bits, numba has no float16 support on cpu
+		bits = np.dtype('u{}'.format(out.dtype.itemsize))
+		_copy_frames(out.view(bits), np.asarray(data).view(bits), starts, offsets[indices + 1] - starts, rows, cols)
+		return out
 
 	def _round_up(self, x, multiple):
-		remainder = x % multiple
-		return x if remainder == 0 else x + multiple - remainder
+		#Works on scalars and arrays
+		return (x + multiple - 1) // multiple * multiple
 
 	def _round_down(self, x, multiple):
 		remainder = x % multiple
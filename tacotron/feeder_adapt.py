@@ -29,13 +29,12 @@ class Feeder:
 		with open(metadata_filename, encoding='utf-8') as f:
 			self._metadata = [line.strip().split('|') for line in f]
 			frame_shift_ms = hparams.hop_size / hparams.sample_rate
-			hours = sum([int(x[4]) for x in self._metadata]) * frame_shift_ms / (3600)
+			self._mel_lens = np.fromiter((int(x[4]) for x in self._metadata), dtype=np.int32, count=len(self._metadata))
+			hours = self._mel_lens.sum(dtype=np.int64) * frame_shift_ms / (3600)
 			log('Loaded metadata for {} examples ({:.2f} hours)'.format(len(self._metadata), hours))
 
-		indices = np.arange(len(self._metadata))
-		train_indices = indices
-
-		self._train_meta = list(np.array(self._metadata)[train_indices])
+		#No test split when adapting, train on every example
+		self._train_meta = list(self._metadata)
 
 		#pad input sequences with the <pad_token> 0 ( _ )
 		self._pad = 0
@@ -52,38 +52,51 @@ class Tacotron():
 		if is_training and is_evaluating:
 			raise RuntimeError('Model can not be in training and evaluation modes at the same time!')
 
-		split_device = '/cpu:0' if self._hparams.tacotron_num_gpus > 1 or self._hparams.split_on_cpu else '/gpu:0'
-		with tf.device(split_device):
-			hp = self._hparams
-			lout_int = [tf.int32]*hp.tacotron_num_gpus
-			lout_float = [tf.float32]*hp.tacotron_num_gpus
-
-			tower_input_lengths = tf.split(input_lengths, num_or_size_splits=hp.tacotron_num_gpus, axis=0)
-			tower_targets_lengths = tf.split(targets_lengths, num_or_size_splits=hp.tacotron_num_gpus, axis=0) if targets_lengths is not None else targets_lengths
-			tower_speaker_id = tf.split(speaker_id, num_or_size_splits=hp.tacotron_num_gpus, axis=0) if speaker_id is not None else speaker_id
-			tower_spk_embedding = tf.split(spk_embedding, num_or_size_splits=hp.tacotron_num_gpus, axis=0) if spk_embedding is not None else spk_embedding
-
-			p_inputs = tf.py_func(split_func, [inputs, split_infos[:, 0]], lout_int)
-			p_mel_targets = tf.py_func(split_func, [mel_targets, split_infos[:,1]], lout_float) if mel_targets is not None else mel_targets
-			p_stop_token_targets = tf.py_func(split_func, [stop_token_targets, split_infos[:,2]], lout_float) if stop_token_targets is not None else stop_token_targets
-			p_linear_targets = tf.py_func(split_func, [linear_targets, split_infos[:,3]], lout_float) if linear_targets is not None else linear_targets
-
-			tower_inputs = []
-			tower_mel_targets = []
-			tower_stop_token_targets = []
-			tower_linear_targets = []
-
-			batch_size = tf.shape(inputs)[0]
-			mel_channels = hp.num_mels
-			linear_channels = hp.num_freq
-			for i in range (hp.tacotron_num_gpus):
-				tower_inputs.append(tf.reshape(p_inputs[i], [batch_size, -1]))
-				if p_mel_targets is not None:
-					tower_mel_targets.append(tf.reshape(p_mel_targets[i], [batch_size, -1, mel_channels]))
-				if p_stop_token_targets is not None:
-					tower_stop_token_targets.append(tf.reshape(p_stop_token_targets[i], [batch_size, -1]))
-				if p_linear_targets is not None:
-					tower_linear_targets.append(tf.reshape(p_linear_targets[i], [batch_size, -1, linear_channels]))
+		hp = self._hparams
+		batch_size = tf.shape(inputs)[0]
+		if hp.tacotron_num_gpus == 1:
+			#Nothing to split on a single device, use the batch tensors where the feeder put them
+			#(going through the split device would copy batches prefetched to the gpu back to the host)
+			tower_input_lengths = [input_lengths]
+			tower_targets_lengths = [targets_lengths] if targets_lengths is not None else targets_lengths
+			tower_speaker_id = [speaker_id] if speaker_id is not None else speaker_id
+			tower_spk_embedding = [spk_embedding] if spk_embedding is not None else spk_embedding
+
+			tower_inputs = [inputs]
+			tower_mel_targets = [mel_targets] if mel_targets is not None else []
+			tower_stop_token_targets = [stop_token_targets] if stop_token_targets is not None else []
+			tower_linear_targets = [linear_targets] if linear_targets is not None else []
+		else:
+			split_device = '/cpu:0' if self._hparams.tacotron_num_gpus > 1 or self._hparams.split_on_cpu else '/gpu:0'
+			with tf.device(split_device):
+				lout_int = [tf.int32]*hp.tacotron_num_gpus
+				lout_float = [tf.float32]*hp.tacotron_num_gpus
+
+				tower_input_lengths = tf.split(input_lengths, num_or_size_splits=hp.tacotron_num_gpus, axis=0)
+				tower_targets_lengths = tf.split(targets_lengths, num_or_size_splits=hp.tacotron_num_gpus, axis=0) if targets_lengths is not None else targets_lengths
+				tower_speaker_id = tf.split(speaker_id, num_or_size_splits=hp.tacotron_num_gpus, axis=0) if speaker_id is not None else speaker_id
+				tower_spk_embedding = tf.split(spk_embedding, num_or_size_splits=hp.tacotron_num_gpus, axis=0) if spk_embedding is not None else spk_embedding
+
+				p_inputs = tf.py_func(split_func, [inputs, split_infos[:, 0]], lout_int)
+				p_mel_targets = tf.py_func(split_func, [mel_targets, split_infos[:,1]], lout_float) if mel_targets is not None else mel_targets
+				p_stop_token_targets = tf.py_func(split_func, [stop_token_targets, split_infos[:,2]], lout_float) if stop_token_targets is not None else stop_token_targets
+				p_linear_targets = tf.py_func(split_func, [linear_targets, split_infos[:,3]], lout_float) if linear_targets is not None else linear_targets
+
+				tower_inputs = []
+				tower_mel_targets = []
+				tower_stop_token_targets = []
+				tower_linear_targets = []
+
+				mel_channels = hp.num_mels
+				linear_channels = hp.num_freq
+				for i in range (hp.tacotron_num_gpus):
+					tower_inputs.append(tf.reshape(p_inputs[i], [batch_size, -1]))
+					if p_mel_targets is not None:
+						tower_mel_targets.append(tf.reshape(p_mel_targets[i], [batch_size, -1, mel_channels]))
+					if p_stop_token_targets is not None:
+						tower_stop_token_targets.append(tf.reshape(p_stop_token_targets[i], [batch_size, -1]))
+					if p_linear_targets is not None:
+						tower_linear_targets.append(tf.reshape(p_linear_targets[i], [batch_size, -1, linear_channels]))
 
 		T2_output_range = (-hp.max_abs_value, hp.max_abs_value) if hp.symmetric_mels else (0, hp.max_abs_value)
 
@@ -1,4 +1,5 @@
 import argparse
+import ctypes
 import os
 import subprocess
 import time
@@ -10,7 +11,7 @@ import numpy as np
 import tensorflow as tf
 from datasets import audio
 from hparams import hparams_debug_string
-from tacotron.feeder import Feeder
+from tacotron.feeder import Feeder, feeder_cpus
 from tacotron.models import create_model
 from tacotron.utils import ValueWindow, plot
 from tacotron.utils.text import sequence_to_text
@@ -23,6 +24,18 @@ log = infolog.log
 def time_string():
 	return datetime.now().strftime('%Y-%m-%d %H:%M')
 
+def set_malloc_thresholds(threshold):
+	#Serve large allocations with mmap and trim the heap eagerly so freed batch buffers go back to the OS.
+	#MALLOC_MMAP_THRESHOLD_/MALLOC_TRIM_THRESHOLD_ are only read at process startup, hence mallopt
+	M_TRIM_THRESHOLD, M_MMAP_THRESHOLD = -1, -3
+	try:
+		libc = ctypes.CDLL('libc.so.6')
+	except OSError:
+		log('glibc not found, keeping default malloc thresholds')
+		return
+	libc.mallopt(M_MMAP_THRESHOLD, threshold)
+	libc.mallopt(M_TRIM_THRESHOLD, threshold)
+
 def add_embedding_stats(summary_writer, embedding_names, paths_to_meta, checkpoint_path):
 	#Create tensorboard projector
 	config = tf.contrib.tensorboard.plugins.projector.ProjectorConfig()
@@ -166,6 +179,9 @@ def train(log_dir, args, hparams):
 	#Start by setting a seed for repeatability
 	tf.set_random_seed(hparams.tacotron_random_seed)
 
+	if hparams.tacotron_malloc_threshold is not None:
+		set_malloc_thresholds(hparams.tacotron_malloc_threshold)
+
 	#Set up data feeder
 	coord = tf.train.Coordinator()
 	with tf.variable_scope('datafeeder') as scope:
@@ -219,6 +235,12 @@ def train(log_dir, args, hparams):
 	config = tf.ConfigProto()
 	config.gpu_options.allow_growth = True
 	config.allow_soft_placement = True
+	#Leave the cores reserved to the feeder threads to them: the TF thread pools created by the session
+	#inherit the affinity of the main thread, restrict it to the remaining cores (feeder threads pin themselves)
+	reserved_cpus = feeder_cpus(hparams)
+	if reserved_cpus is not None:
+		os.sched_setaffinity(0, set(os.sched_getaffinity(0)) - reserved_cpus)
+		config.intra_op_parallelism_threads = len(os.sched_getaffinity(0))
 
 	#Train
 	with tf.Session(config=config) as sess:
@@ -251,7 +273,7 @@ def train(log_dir, args, hparams):
 				saver.save(sess, checkpoint_path, global_step=global_step)
 
 			#initializing feeder
-			feeder.start_threads(sess)
+			sess.run(feeder.initializer)
 
 			#Training loop
 			while not coord.should_stop() and step < args.tacotron_train_steps: